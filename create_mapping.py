@@ -9,14 +9,13 @@ Example:
 
 """
 
-import sys
-import csv
 import pathlib
 import argparse
-import collections
-import operator
 from datetime import datetime
 
+from wikidump import (IOPipeline, parse_size, format_size, run_pipeline,
+                      DEFAULT_IO_THREADS, DEFAULT_BUFFER_SIZE)
+
 
 def valid_date(date_str):
 
@@ -44,12 +43,27 @@ def valid_date(date_str):
     return date
 
 
-# How do you remove duplicates from a list whilst preserving order?
-# https://stackoverflow.com/a/480227/2377454
-def uniqfy_list(seq):
-    seen = set()
-    seen_add = seen.add
-    return [x for x in seq if not (x in seen or seen_add(x))]
+def valid_size(size_str):
+    try:
+        size = parse_size(size_str)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+    return size
+
+
+def valid_io_threads(threads_str):
+    try:
+        threads = int(threads_str)
+    except ValueError:
+        threads = -1
+
+    if threads < 0:
+        msg = ("Not a valid number of I/O threads: '{0}', it must be a " + \
+               "non-negative integer.").format(threads_str)
+        raise argparse.ArgumentTypeError(msg)
+
+    return threads
 
 
 if __name__ == '__main__':
@@ -75,9 +89,6 @@ if __name__ == '__main__':
     parser.add_argument('--name',
                         action='store_true',
                         help='Create a file with the graph with names.')
-    parser.add_argument('-o', '--output',
-                        type=pathlib.Path,
-                        help='Output file name [default: stdout].')
     parser.add_argument('--oldmap',
                         action='store_true',
                         help='Create oldmap')
@@ -95,174 +106,42 @@ if __name__ == '__main__':
     parser.add_argument('--skip-snapshot-header',
                         action='store_true',
                         help='Skip snapshot file header')
+    parser.add_argument('--io-threads',
+                        type=valid_io_threads,
+                        default=DEFAULT_IO_THREADS,
+                        help='Number of background I/O threads, 0 disables '
+                             'them [default: {}].'.format(DEFAULT_IO_THREADS))
+    parser.add_argument('--buffer-size',
+                        type=valid_size,
+                        default=DEFAULT_BUFFER_SIZE,
+                        help='Size of the I/O buffers, e.g. 512k or 4M '
+                             '[default: {}].'
+                             .format(format_size(DEFAULT_BUFFER_SIZE)))
     args = parser.parse_args()
 
     date = args.date
     lang = args.lang
 
-    graphfile = args.graph.open('r')
-    snapshotfile = args.snapshot.open('r')
-
-    outfile = None
-    if args.output is None:
-        outfile = sys.stdout
-    else:
-        outfile = output.open('w+')
-
-    graphreader = csv.reader(graphfile, delimiter=args.graph_delimiter)
-    snapshotreader = csv.reader(snapshotfile, delimiter=args.snapshot_delimiter)
-    if args.skip_graph_header:
-        next(graphreader)
-    if args.skip_snapshot_header:
-        next(snapshotreader)
-
-    graph = uniqfy_list(((int(e[0]),int(e[1])) for e in graphreader))
-    graph_numedges = len(graph)
-    graph_numnodes = len(set([node for edge in graph
-                              for node in edge]))
-
-    tmpsnap = [(int(line[0]), line[1])
-               for line in snapshotreader]
-    dsnap = dict(tmpsnap)
-    assert len(tmpsnap) == len(dsnap)
-    del tmpsnap
-
-    odsnap = collections.OrderedDict(sorted(dsnap.items()))
-    assert len(dsnap) == len(odsnap)
-    del dsnap
-
-    enodsnap = enumerate(odsnap)
-
-    idmap = dict()
-    for newid, oldid in enodsnap:
-        idmap[oldid] = newid
-
-    imfname = '{}wiki.idmap_o2n.{}.csv'.format(lang,
-                                               date.strftime('%Y-%m-%d')
-                                               )
-    with open(imfname, 'w+') as idmapfile:
-        idmap_csv = csv.writer(idmapfile, delimiter=' ')
-
-        for oid, nid in idmap.items():
-            idmap_csv.writerow((oid, nid))
-
-    gsfname = '{}wiki.wikigraph.shift.{}.csv'.format(lang,
-                                                     date.strftime('%Y-%m-%d')
-                                                     )
-    with open(gsfname, 'w+') as graphshiftfile:
-        graphshift = csv.writer(graphshiftfile, delimiter='\t')
-
-        for oid1, oid2 in graph:
-            try:
-                nid1 = idmap[oid1]
-                nid2 = idmap[oid2]
-            except KeyError as err:
-                print("Error: old id nodes ({}, {}) not found."
-                      .format(oid1, oid2),
-                      file=sys.stderr)
-                continue
-
-            graphshift.writerow((nid1, nid2))
-
-    prname = '{}wiki.wikigraph.pagerank.{}.csv'.format(lang,
-                                                    date.strftime('%Y-%m-%d')
-                                                    )
-    with open(prname, 'w+') as pagerankfile:
-        pagerank = csv.writer(pagerankfile, delimiter=' ')
-        with open(gsfname, 'r') as graphshiftfile:
-            graphshift = csv.reader(graphshiftfile, delimiter='\t')
-            shift = [(int(e1), int(e2)) for e1, e2 in graphshift]
-            shift_nodes = set([node
-                               for edge in shift
-                               for node in edge
-                               ])
-            shift_numedges = len(shift)
-            shift_numnodes = len(shift_nodes)
-
-            # if shift_nodes is empty, max causes an error
-            if shift_nodes:
-                shift_maxindex = max(shift_nodes) + 1
-            else:
-                shift_maxindex = 0
-
-            del shift
-            del shift_nodes
-
-            assert graph_numedges == shift_numedges
-            assert graph_numnodes == shift_numnodes
-
-            pagerank.writerow((shift_maxindex, shift_numedges))
-
-        with open(gsfname, 'r') as graphshiftfile:
-            graphshift = csv.reader(graphshiftfile, delimiter='\t')
-            for l1, l2 in graphshift:
-                pagerank.writerow((l1, l2))
-
-
-    nodsnap = dict()
-    nsfname = '{}wiki.wikigraph.snapshot.{}.csv'.format(lang,
-                                                        date.strftime('%Y-%m-%d')
-                                                        )
-    with open(nsfname, 'w+') as newsnapshotfile:
-        newsnapshot = csv.writer(newsnapshotfile, delimiter='\t')
-
-        for oid, v in odsnap.items():
-            nid = idmap[oid]
-
-            nodsnap[nid] = v
-            newsnapshot.writerow((nid, v))
-
+    datestr = date.strftime('%Y-%m-%d')
+    outputs = {
+        'idmap': '{}wiki.idmap_o2n.{}.csv'.format(lang, datestr),
+        'graphshift': '{}wiki.wikigraph.shift.{}.csv'.format(lang, datestr),
+        'pagerank': '{}wiki.wikigraph.pagerank.{}.csv'.format(lang, datestr),
+        'snapshot': '{}wiki.wikigraph.snapshot.{}.csv'.format(lang, datestr),
+        }
     if args.name:
-        tmpsl = set()
-        newtmpsl = set()
-        ssfname = '{}wiki.wikigraph.name.{}.csv'.format(lang,
-                                                        date.strftime('%Y-%m-%d')
-                                                        )
-        with open(ssfname , 'w+') as snapshotnamefile:
-            snapshotname = csv.writer(snapshotnamefile, delimiter='\t')
-
-            for e1, e2 in graph:
-                en1 = odsnap[e1]
-                en2 = odsnap[e2]
-
-                ne1 = idmap[e1]
-                ne2 = idmap[e2]
-
-                nen1 = nodsnap[ne1]
-                nen2 = nodsnap[ne2]
-
-                tmpsl.add((en1, en2))
-                newtmpsl.add((nen1, nen2))
-
-                snapshotname.writerow((en1, en2))
-
-        assert tmpsl == newtmpsl
-        del tmpsl
-        del newtmpsl
-
+        outputs['name'] = ('{}wiki.wikigraph.name.{}.csv'
+                           .format(lang, datestr))
     if args.oldmap:
-        newcounter = 0
-        idmap_o2n = dict()
-
-        for e1, e2 in graph:
-            if e1 not in idmap_o2n:
-                idmap_o2n[e1] = newcounter
-                newcounter = newcounter + 1
-
-            if e2 not in idmap_o2n:
-                idmap_o2n[e2] = newcounter
-                newcounter = newcounter + 1
-
-        omgfname = '{}wiki.oldmap.{}.csv'.format(lang,
-                                                 date.strftime('%Y-%m-%d')
-                                                 )
-        with open(omgfname, 'w+') as oldmapgraphfile:
-            oldmapgraph = csv.writer(oldmapgraphfile, delimiter='\t')
-
-            newgraph = [(idmap_o2n[e1], idmap_o2n[e2])
-                        for e1, e2 in graph]
-
-            for ne1, ne2 in sorted(newgraph, key=operator.itemgetter(0, 1)):
-                oldmapgraph.writerow((ne1, ne2))
+        outputs['oldmap'] = '{}wiki.oldmap.{}.csv'.format(lang, datestr)
+
+    with IOPipeline(io_threads=args.io_threads,
+                    buffer_size=args.buffer_size) as pipe:
+        run_pipeline(args.graph, args.snapshot, outputs,
+                     pipe=pipe,
+                     graph_delimiter=args.graph_delimiter,
+                     snapshot_delimiter=args.snapshot_delimiter,
+                     skip_graph_header=args.skip_graph_header,
+                     skip_snapshot_header=args.skip_snapshot_header)
 
     exit(0)
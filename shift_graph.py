@@ -13,13 +13,18 @@ Options:
   --no-mapfile                      Do not output mapfile.
   --no-shift                        Do not output shiftfile
                                     (implies --no-mapfile).
+  --io-threads N                    Number of background I/O threads,
+                                    0 disables them [default: 0].
+  --buffer-size SIZE                Size of the I/O buffers, e.g. 512k or 4M
+                                    [default: 4M].
   -h --help                         Show this screen.
   --version                         Show version.
 """
-from docopt import docopt
-import csv
+from docopt import docopt, DocoptExit
 import os
 
+from wikidump import IOPipeline, parse_size, run_pipeline
+
 
 if __name__ == '__main__':
     arguments = docopt(__doc__, version='shift_graph 0.2')
@@ -39,9 +44,6 @@ if __name__ == '__main__':
 
     create_mapfile = not arguments['--no-mapfile']
 
-    nodemap = dict()
-    nodeid = 0
-
     lang = basename.split('.')[0]
     adate = basename.split('.')[2]
     outfile = (os.path.join(dirname,
@@ -60,70 +62,39 @@ if __name__ == '__main__':
                             )
                )
 
-    is_header = True
-    with open(infile, 'r') as infp:
-        reader = csv.reader(infp, delimiter=in_delimiter)
-        with open(oidfile, 'w+') as oidfp:
-            oidwriter = csv.writer(oidfp, delimiter=out_delimiter)
-            for line in reader:
-
-                if only_id:
-                    sourceid = line[0]
-                    targetid = line[1]
-                else:
-                    sourceid = line[0]
-                    sourcetitle = line[1]
-                    targetid = line[2]
-                    targettitle = line[3]
-
-                if is_header:
-                    oidwriter.writerow([sourceid, targetid])
-                    is_header = False
-                    continue
-
-                oidwriter.writerow([sourceid, targetid])
-
-
-    is_header = True
+    outputs = {'onlyid': oidfile}
     if create_shift:
-        with open(infile, 'r') as infp:
-            reader = csv.reader(infp, delimiter=in_delimiter)
-
-            outwriter = csv.writer(outfp, delimiter=out_delimiter)
-            for line in reader:
-                with open(outfile, 'w+') as outfp:
-                    sourceid = int(sourceid)
-                    targetid = int(targetid)
-                    shiftsourceid = -1
-                    shifttargetid = -1
-
-                    if is_header:
-                        outwriter.writerow([sourceid, targetid])
-                        is_header = False
-                        continue
-
-                    if sourceid not in nodemap:
-                        shiftsourceid = nodeid
-                        nodemap[sourceid] = nodeid
-                        nodeid = nodeid + 1
-                    else:
-                        shiftsourceid = nodemap[sourceid]
-
-                    if targetid not in nodemap:
-                        shifttargetid = nodeid
-                        nodemap[targetid] = nodeid
-                        nodeid = nodeid + 1
-                    else:
-                        shifttargetid = nodemap[targetid]
-
-                    outwriter.writerow([shiftsourceid, shifttargetid])
-
-            if create_mapfile:
-                with open(mapfile, 'w+') as mapfp:
-                    mapwriter = csv.writer(mapfp, delimiter='\t')
-                    mapwriter.writerow(['original_id', 'shift_id'])
-                    for orig in sorted(nodemap.keys()):
-                        shift = nodemap[orig]
-                        mapwriter.writerow([orig, shift])
+        outputs['shift'] = outfile
+    if create_mapfile:
+        outputs['shiftmap'] = mapfile
+
+    if only_id:
+        columns = (0, 1)
+    else:
+        # source id, source title, target id, target title
+        columns = (0, 2)
+
+    try:
+        io_threads = int(arguments['--io-threads'])
+    except ValueError:
+        io_threads = -1
+    if io_threads < 0:
+        raise DocoptExit("Not a valid number of I/O threads: '{}', it must "
+                         "be a non-negative integer."
+                         .format(arguments['--io-threads']))
+
+    try:
+        buffer_size = parse_size(arguments['--buffer-size'])
+    except ValueError as err:
+        raise DocoptExit(str(err))
+
+    with IOPipeline(io_threads=io_threads, buffer_size=buffer_size) as pipe:
+        run_pipeline(infile,
+                     outputs=outputs,
+                     pipe=pipe,
+                     graph_delimiter=in_delimiter,
+                     graph_columns=columns,
+                     skip_graph_header=True,
+                     shift_delimiter=out_delimiter)
 
     exit(0)
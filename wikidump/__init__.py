@@ -0,0 +1,15 @@
+"""Utilities to process Wikipedia dump files.
+
+The scripts in the repository root are thin command line wrappers around
+this package, which can also be imported to chain the stages in-process.
+"""
+
+from .graph import (read_header, read_graph, read_snapshot, dedup_edges,
+                    iter_nodes, build_idmap, relabel, write_rows, write_edges,
+                    write_idmap, write_pagerank, write_snapshot, write_names)
+from .pipeline import (SHIFT_OUTPUTS, MAPPING_OUTPUTS, Mapping, shift_graph,
+                       create_mapping, run_pipeline)
+from .pipeline_io import (IOPipeline, PrefetchReader, WriteBehindWriter,
+                          open_file, parse_size, format_size,
+                          DEFAULT_IO_THREADS,
+                          DEFAULT_BUFFER_SIZE, DEFAULT_QUEUE_DEPTH)
@@ -0,0 +1,157 @@
+"""Streaming building blocks for wikilink graphs.
+
+Readers take an iterable of text lines (e.g. a file or a reader from
+IOPipeline.open_read) and yield parsed tuples, writers take the parsed data
+and a writable file-like object. Everything in between works on generators,
+so stages can be chained in memory without going through text files.
+"""
+
+import csv
+import sys
+
+
+def read_header(fp, delimiter=' ', columns=(0, 1)):
+    """Consume the first line of fp and return its selected fields.
+
+    Returns None if fp is empty.
+    """
+    row = next(csv.reader(fp, delimiter=delimiter), None)
+    if row is None:
+        return None
+    return [row[col] for col in columns]
+
+
+def read_graph(fp, delimiter=' ', columns=(0, 1), skip_header=False):
+    """Yield (source, target) id pairs from a graph file.
+
+    columns selects the source and target id fields, e.g. (0, 2) for the
+    wikilink graph with titles (source id, source title, target id,
+    target title).
+    """
+    source_col, target_col = columns
+
+    reader = csv.reader(fp, delimiter=delimiter)
+    if skip_header:
+        next(reader, None)
+
+    for row in reader:
+        yield (int(row[source_col]), int(row[target_col]))
+
+
+def read_snapshot(fp, delimiter=',', skip_header=False):
+    """Yield (page id, title) pairs from a snapshot file."""
+    reader = csv.reader(fp, delimiter=delimiter)
+    if skip_header:
+        next(reader, None)
+
+    for row in reader:
+        yield (int(row[0]), row[1])
+
+
+# How do you remove duplicates from a list whilst preserving order?
+# https://stackoverflow.com/a/480227/2377454
+def dedup_edges(edges):
+    """Yield edges dropping duplicates, preserving the original order."""
+    seen = set()
+    seen_add = seen.add
+    for edge in edges:
+        if edge not in seen:
+            seen_add(edge)
+            yield edge
+
+
+def iter_nodes(edges):
+    """Yield the endpoints of every edge, source first."""
+    for source, target in edges:
+        yield source
+        yield target
+
+
+def build_idmap(ids):
+    """Map each distinct id to its rank in ascending order."""
+    return {oldid: newid for newid, oldid in enumerate(sorted(set(ids)))}
+
+
+def relabel(edges, idmap, on_missing='skip'):
+    """Yield edges with both endpoints translated through idmap.
+
+    on_missing decides what happens to ids that are not in idmap:
+      - 'skip': print an error and drop the edge;
+      - 'assign': give the id the next free label, in order of appearance
+        (idmap is updated in place);
+      - 'raise': raise KeyError.
+    """
+    if on_missing not in ('skip', 'assign', 'raise'):
+        raise ValueError("Invalid value for on_missing: '{}'"
+                         .format(on_missing))
+
+    for oid1, oid2 in edges:
+        if on_missing == 'assign':
+            if oid1 not in idmap:
+                idmap[oid1] = len(idmap)
+            if oid2 not in idmap:
+                idmap[oid2] = len(idmap)
+
+        try:
+            nid1 = idmap[oid1]
+            nid2 = idmap[oid2]
+        except KeyError:
+            if on_missing == 'raise':
+                raise
+            print("Error: old id nodes ({}, {}) not found."
+                  .format(oid1, oid2),
+                  file=sys.stderr)
+            continue
+
+        yield (nid1, nid2)
+
+
+def write_rows(rows, fp, delimiter='\t', header=None):
+    """Write rows to fp, optionally preceded by a header row."""
+    writer = csv.writer(fp, delimiter=delimiter)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+
+
+def write_edges(edges, fp, delimiter='\t', header=None):
+    """Write (source, target) pairs to fp, optionally preceded by a header."""
+    write_rows(edges, fp, delimiter=delimiter, header=header)
+
+
+def write_idmap(idmap, fp, delimiter=' ', header=None, sort=False):
+    """Write (old id, new id) pairs, in insertion order or sorted by old id."""
+    if sort:
+        items = sorted(idmap.items())
+    else:
+        items = idmap.items()
+    write_rows(items, fp, delimiter=delimiter, header=header)
+
+
+def write_pagerank(edges, fp, delimiter=' '):
+    """Write edges preceded by a '<number of nodes> <number of edges>' row.
+
+    The number of nodes is the highest node id + 1, edges must be a sequence
+    since it is traversed twice.
+    """
+    nodes = set(iter_nodes(edges))
+
+    # if nodes is empty, max causes an error
+    if nodes:
+        maxindex = max(nodes) + 1
+    else:
+        maxindex = 0
+
+    write_rows(edges, fp, delimiter=delimiter, header=(maxindex, len(edges)))
+
+
+def write_snapshot(snapshot, idmap, fp, delimiter='\t'):
+    """Write (new id, title) pairs for the (old id, title) pairs in snapshot."""
+    write_rows(((idmap[oid], title) for oid, title in snapshot),
+               fp, delimiter=delimiter)
+
+
+def write_names(edges, titles, fp, delimiter='\t'):
+    """Write (source title, target title) pairs for edges."""
+    write_rows(((titles[e1], titles[e2]) for e1, e2 in edges),
+               fp, delimiter=delimiter)
@@ -0,0 +1,246 @@
+"""Compose the graph stages in memory.
+
+Each stage takes already parsed data and writes only the outputs listed in
+its outputs dictionary (output name -> path), so the stages can be chained
+in-process without writing and re-parsing intermediate files.
+
+Example:
+    with IOPipeline() as pipe:
+        run_pipeline('en.wikilink_graph.2005-12-15.csv',
+                     'snapshot.2005-12-15.csv',
+                     outputs={'pagerank': 'enwiki.pagerank.2005-12-15.csv'},
+                     pipe=pipe,
+                     graph_delimiter='\\t',
+                     graph_columns=(0, 2),
+                     skip_graph_header=True)
+"""
+
+import collections
+import contextlib
+import csv
+import operator
+
+from .graph import (read_header, read_graph, read_snapshot, dedup_edges,
+                    build_idmap, relabel, write_edges, write_idmap,
+                    write_pagerank, write_snapshot, write_names)
+from .pipeline_io import IOPipeline
+
+
+SHIFT_OUTPUTS = ('onlyid', 'shift', 'shiftmap')
+MAPPING_OUTPUTS = ('idmap', 'graphshift', 'pagerank', 'snapshot', 'name',
+                   'oldmap')
+
+Mapping = collections.namedtuple('Mapping', ['graph', 'idmap', 'shift'])
+
+
+@contextlib.contextmanager
+def _pipeline(pipe):
+    # use the caller's pipeline or a private one that is closed at the end
+    if pipe is not None:
+        yield pipe
+    else:
+        with IOPipeline() as pipe:
+            yield pipe
+
+
+def _check_outputs(outputs, allowed):
+    unknown = set(outputs) - set(allowed)
+    if unknown:
+        raise ValueError('Unknown outputs: {}'
+                         .format(', '.join(sorted(unknown))))
+
+
+def _tap(edges, fp, delimiter='\t', header=None):
+    # pass edges through, writing each of them to fp on the way
+    writer = csv.writer(fp, delimiter=delimiter)
+    if header is not None:
+        writer.writerow(header)
+
+    for edge in edges:
+        writer.writerow(edge)
+        yield edge
+
+
+def shift_graph(edges, outputs=None, pipe=None, delimiter='\t', header=None):
+    """Relabel edges with consecutive ids in order of first appearance.
+
+    Outputs:
+      - 'onlyid': the original edges;
+      - 'shift': the relabeled edges;
+      - 'shiftmap': the (original id, shifted id) map, sorted by original id.
+
+    header, if given, is written as the first row of 'onlyid' and 'shift'.
+    edges is consumed in a single pass. Returns the map from original to
+    shifted ids.
+    """
+    outputs = outputs or {}
+    _check_outputs(outputs, SHIFT_OUTPUTS)
+
+    nodemap = dict()
+    with _pipeline(pipe) as pipe:
+        with contextlib.ExitStack() as stack:
+            if 'onlyid' in outputs:
+                oidfp = stack.enter_context(
+                    pipe.open_write(outputs['onlyid']))
+                edges = _tap(edges, oidfp, delimiter=delimiter, header=header)
+
+            shifted = relabel(edges, nodemap, on_missing='assign')
+            if 'shift' in outputs:
+                outfp = stack.enter_context(pipe.open_write(outputs['shift']))
+                write_edges(shifted, outfp, delimiter=delimiter, header=header)
+            else:
+                # exhaust the generator, we only need nodemap
+                collections.deque(shifted, maxlen=0)
+
+        if 'shiftmap' in outputs:
+            with pipe.open_write(outputs['shiftmap']) as mapfp:
+                write_idmap(nodemap, mapfp,
+                            delimiter='\t',
+                            header=['original_id', 'shift_id'],
+                            sort=True)
+
+    return nodemap
+
+
+def create_mapping(edges, snapshot, outputs=None, pipe=None):
+    """Relabel the graph with the rank of each page id in the snapshot.
+
+    edges and snapshot are iterables, both are consumed before any output
+    is opened. Duplicate edges are dropped. Edges with an endpoint that is
+    not in the snapshot are reported on stderr and left out of the relabeled
+    graph and of the 'graphshift', 'pagerank' and 'name' outputs. Raises
+    ValueError if the snapshot contains the same page id more than once.
+
+    Outputs:
+      - 'idmap': the (old id, new id) map;
+      - 'graphshift': the relabeled graph;
+      - 'pagerank': the relabeled graph with a '<nodes> <edges>' header;
+      - 'snapshot': the snapshot with new ids;
+      - 'name': the graph with page titles;
+      - 'oldmap': the whole graph relabeled in order of first appearance,
+        sorted.
+
+    Returns a Mapping with the deduplicated graph (including the skipped
+    edges), the id map and the relabeled graph.
+    """
+    outputs = outputs or {}
+    _check_outputs(outputs, MAPPING_OUTPUTS)
+
+    graph = list(dedup_edges(edges))
+
+    titles = dict()
+    duplicates = set()
+    for pageid, title in snapshot:
+        if pageid in titles:
+            duplicates.add(pageid)
+        titles[pageid] = title
+
+    if duplicates:
+        raise ValueError('Duplicate page ids in snapshot: {}'
+                         .format(', '.join(str(d)
+                                           for d in sorted(duplicates))))
+
+    idmap = build_idmap(titles)
+    shift = list(relabel(graph, idmap))
+
+    with _pipeline(pipe) as pipe:
+        if 'idmap' in outputs:
+            with pipe.open_write(outputs['idmap']) as idmapfp:
+                write_idmap(idmap, idmapfp, delimiter=' ')
+
+        if 'graphshift' in outputs:
+            with pipe.open_write(outputs['graphshift']) as graphshiftfp:
+                write_edges(shift, graphshiftfp, delimiter='\t')
+
+        if 'pagerank' in outputs:
+            with pipe.open_write(outputs['pagerank']) as pagerankfp:
+                write_pagerank(shift, pagerankfp, delimiter=' ')
+
+        if 'snapshot' in outputs:
+            with pipe.open_write(outputs['snapshot']) as snapshotfp:
+                write_snapshot(sorted(titles.items()), idmap, snapshotfp,
+                               delimiter='\t')
+
+        if 'name' in outputs:
+            with pipe.open_write(outputs['name']) as namefp:
+                write_names(((e1, e2) for e1, e2 in graph
+                             if e1 in titles and e2 in titles),
+                            titles, namefp, delimiter='\t')
+
+        if 'oldmap' in outputs:
+            oldmap = sorted(relabel(graph, dict(), on_missing='assign'),
+                            key=operator.itemgetter(0, 1))
+            with pipe.open_write(outputs['oldmap']) as oldmapfp:
+                write_edges(oldmap, oldmapfp, delimiter='\t')
+
+    return Mapping(graph=graph, idmap=idmap, shift=shift)
+
+
+def run_pipeline(graph, snapshot=None, outputs=None, pipe=None,
+                 graph_delimiter=' ',
+                 snapshot_delimiter=',',
+                 graph_columns=(0, 1),
+                 skip_graph_header=False,
+                 skip_snapshot_header=False,
+                 shift_delimiter='\t'):
+    """Read a graph (and a snapshot) once and run all the stages on it.
+
+    outputs may contain any of SHIFT_OUTPUTS and MAPPING_OUTPUTS, only the
+    requested files are written. The shift stage runs only if one of its
+    outputs is requested, the mapping stage only if a snapshot is given.
+
+    If skip_graph_header is set, the id columns of the graph header are
+    written as the first row of the 'onlyid' and 'shift' outputs, like
+    shift_graph.py does.
+
+    The graph is streamed through the stages and kept in memory only once
+    (twice if both stages run, since the shift stage needs the edges with
+    duplicates).
+
+    Returns a (nodemap, mapping) tuple, either of them is None if the
+    corresponding stage did not run.
+    """
+    outputs = outputs or {}
+    _check_outputs(outputs, SHIFT_OUTPUTS + MAPPING_OUTPUTS)
+
+    shift_outputs = {k: v for k, v in outputs.items() if k in SHIFT_OUTPUTS}
+    mapping_outputs = {k: v for k, v in outputs.items()
+                       if k in MAPPING_OUTPUTS}
+
+    nodemap = None
+    mapping = None
+    with _pipeline(pipe) as pipe, contextlib.ExitStack() as stack:
+        graphfp = stack.enter_context(pipe.open_read(graph))
+
+        header = None
+        if skip_graph_header:
+            header = read_header(graphfp,
+                                 delimiter=graph_delimiter,
+                                 columns=graph_columns)
+
+        edges = read_graph(graphfp,
+                           delimiter=graph_delimiter,
+                           columns=graph_columns)
+
+        if shift_outputs:
+            if snapshot is not None:
+                # both stages consume the edges
+                edges = list(edges)
+
+            nodemap = shift_graph(edges, shift_outputs,
+                                  pipe=pipe,
+                                  delimiter=shift_delimiter,
+                                  header=header)
+
+        if snapshot is not None:
+            # the snapshot is streamed into create_mapping, which reads the
+            # edges and the pages before opening any output
+            snapshotfp = stack.enter_context(pipe.open_read(snapshot))
+            pages = read_snapshot(snapshotfp,
+                                  delimiter=snapshot_delimiter,
+                                  skip_header=skip_snapshot_header)
+
+            mapping = create_mapping(edges, pages, mapping_outputs,
+                                     pipe=pipe)
+
+    return nodemap, mapping
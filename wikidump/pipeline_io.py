@@ -0,0 +1,450 @@
+"""Pipelined background I/O for the wikidump utilities.
+
+Reader threads prefetch (and decompress) large blocks of an input file into a
+bounded queue, writer threads flush large output buffers to disk, so that
+parsing and relabeling on the main thread overlap with disk waits. Memory is
+capped at roughly ``queue_depth * buffer_size`` per open stream.
+
+The background threads only do raw reads, writes and (de)compression, which
+release the GIL, decoding and line splitting stay on the consuming thread.
+Background I/O is disabled by default (io_threads=0): on a local disk there
+are no waits to hide and the threads only add overhead, enable it for slow
+or network filesystems.
+
+Example:
+    with IOPipeline(io_threads=2, buffer_size=parse_size('4M')) as pipe:
+        reader = csv.reader(pipe.open_read('graph.csv.gz'), delimiter=' ')
+        writer = csv.writer(pipe.open_write('shift.csv'), delimiter='\\t')
+        for row in reader:
+            writer.writerow(row)
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+
+
+DEFAULT_IO_THREADS = 0
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+DEFAULT_QUEUE_DEPTH = 4
+
+# how long a background thread waits on a full/empty queue before checking
+# whether the other end went away
+_POLL_TIMEOUT = 0.1
+
+_SIZE_SUFFIXES = {'': 1,
+                  'K': 1024,
+                  'M': 1024 ** 2,
+                  'G': 1024 ** 3,
+                  }
+
+_OPENERS = {'.gz': gzip.open,
+            '.bz2': bz2.open,
+            '.xz': lzma.open,
+            '.lzma': lzma.open,
+            }
+
+# end-of-stream marker for the queues
+_EOF = object()
+
+
+def parse_size(size_str):
+    """Parse a size like '65536', '512k' or '4M' into a number of bytes."""
+    size_str = str(size_str).strip().upper()
+    if size_str.endswith('B'):
+        size_str = size_str[:-1]
+
+    suffix = size_str[-1:] if size_str[-1:] in _SIZE_SUFFIXES else ''
+    number = size_str[:len(size_str) - len(suffix)]
+
+    try:
+        size = int(number) * _SIZE_SUFFIXES[suffix]
+    except ValueError:
+        raise ValueError("Not a valid size: '{}'".format(size_str))
+
+    if size <= 0:
+        raise ValueError("Size must be positive: '{}'".format(size_str))
+
+    return size
+
+
+def format_size(size):
+    """Format a number of bytes in the form accepted by parse_size."""
+    for suffix in ('G', 'M', 'K'):
+        unit = _SIZE_SUFFIXES[suffix]
+        if size >= unit and size % unit == 0:
+            return '{}{}'.format(size // unit, suffix)
+
+    return str(size)
+
+
+def open_file(path, mode='r', **kwargs):
+    """Open path, transparently (de)compressing it based on its suffix."""
+    path = str(path)
+    for suffix, opener in _OPENERS.items():
+        if path.endswith(suffix):
+            if 'b' not in mode and 't' not in mode:
+                mode = mode + 't'
+            return opener(path, mode, **kwargs)
+
+    return open(path, mode, **kwargs)
+
+
+class _QueueStream(io.RawIOBase):
+    """Raw binary stream over the blocks put in a queue by a reader thread."""
+
+    def __init__(self, blocks, on_eof=None):
+        self._blocks = blocks
+        self._block = memoryview(b'')
+        self._eof = False
+        self._on_eof = on_eof
+
+    def _set_eof(self):
+        self._eof = True
+        if self._on_eof is not None:
+            self._on_eof()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self._block:
+            if self._eof:
+                return 0
+
+            item = self._blocks.get()
+            if item is _EOF:
+                self._set_eof()
+                return 0
+            if isinstance(item, Exception):
+                self._set_eof()
+                raise item
+            self._block = memoryview(item)
+
+        size = min(len(buf), len(self._block))
+        buf[:size] = self._block[:size]
+        self._block = self._block[size:]
+        return size
+
+
+class PrefetchReader(object):
+    """Iterate over the lines of a file read by a background thread.
+
+    on_release is called once the background thread is no longer needed,
+    i.e. as soon as the whole file has been consumed (or on close), on_close
+    is called with the reader when it is closed.
+    """
+
+    def __init__(self, path,
+                 encoding='utf-8',
+                 buffer_size=DEFAULT_BUFFER_SIZE,
+                 queue_depth=DEFAULT_QUEUE_DEPTH,
+                 on_release=None,
+                 on_close=None):
+        self.path = path
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._on_release = on_release
+        self._on_close = on_close
+        self._released = False
+        self._closed = False
+
+        # decoding and line splitting happen in the consuming thread, the
+        # background thread only reads (and decompresses) raw blocks
+        self._text = io.TextIOWrapper(
+            io.BufferedReader(_QueueStream(self._queue,
+                                           on_eof=self._release)),
+            encoding=encoding,
+            newline='')
+
+        # open in the caller's thread so that errors like a missing file are
+        # raised immediately
+        self._fp = open_file(path, 'rb')
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='prefetch:{}'.format(path),
+                                        daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            while True:
+                block = self._fp.read(self.buffer_size)
+                if not block:
+                    break
+                if not self._put(block):
+                    return
+
+            self._put(_EOF)
+        except Exception as err:
+            self._put(err)
+        finally:
+            self._fp.close()
+
+    def _release(self):
+        if self._released:
+            return
+        self._released = True
+
+        if self._on_release is not None:
+            self._on_release()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._text)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        self._stop.set()
+        self._thread.join()
+        self._text.close()
+
+        self._release()
+        if self._on_close is not None:
+            self._on_close(self)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class WriteBehindWriter(object):
+    """File-like object whose buffers are flushed by a background thread.
+
+    On close, once the background thread has finished, on_release is called
+    and then on_close with the writer.
+    """
+
+    def __init__(self, path,
+                 encoding='utf-8',
+                 buffer_size=DEFAULT_BUFFER_SIZE,
+                 queue_depth=DEFAULT_QUEUE_DEPTH,
+                 on_release=None,
+                 on_close=None):
+        self.path = path
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._on_release = on_release
+        self._on_close = on_close
+        self._closed = False
+        self._error = None
+
+        self._chunks = []
+        self._buffered = 0
+
+        self._fp = open_file(path, 'wb')
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='writebehind:{}'.format(path),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _EOF:
+                    break
+                # after an error keep draining the queue so that the
+                # producer never blocks on a full queue
+                if self._error is None:
+                    try:
+                        self._fp.write(item)
+                    except Exception as err:
+                        self._error = err
+        finally:
+            try:
+                self._fp.close()
+            except Exception as err:
+                if self._error is None:
+                    self._error = err
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, text):
+        if self._closed:
+            raise ValueError('I/O operation on closed file.')
+
+        self._chunks.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+        return len(text)
+
+    def flush(self):
+        self._check_error()
+        if self._chunks:
+            data = ''.join(self._chunks).encode(self.encoding)
+            self._chunks = []
+            self._buffered = 0
+            self._queue.put(data)
+
+    def close(self):
+        if self._closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            self._queue.put(_EOF)
+            self._thread.join()
+
+            if self._on_release is not None:
+                self._on_release()
+            if self._on_close is not None:
+                self._on_close(self)
+
+        self._check_error()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class IOPipeline(object):
+    """Hand out prefetching readers and write-behind writers.
+
+    At most io_threads streams get a background thread at the same time,
+    streams opened beyond that (or all of them, when io_threads is 0) fall
+    back to plain synchronous file objects. Closing the pipeline closes every
+    stream opened through it that is still open, streams that were already
+    closed are not kept around.
+    """
+
+    def __init__(self,
+                 io_threads=DEFAULT_IO_THREADS,
+                 buffer_size=DEFAULT_BUFFER_SIZE,
+                 queue_depth=DEFAULT_QUEUE_DEPTH,
+                 encoding='utf-8'):
+        if io_threads < 0:
+            raise ValueError('io_threads must be non-negative')
+
+        self.io_threads = io_threads
+        self.buffer_size = buffer_size
+        self.queue_depth = queue_depth
+        self.encoding = encoding
+
+        self._lock = threading.Lock()
+        self._free_threads = io_threads
+        self._streams = []
+
+    def _acquire_thread(self):
+        with self._lock:
+            if self._free_threads > 0:
+                self._free_threads -= 1
+                return True
+            return False
+
+    def _release_thread(self):
+        with self._lock:
+            self._free_threads += 1
+
+    def _add_stream(self, stream):
+        with self._lock:
+            # plain file objects have no close hook, drop the closed ones here
+            self._streams = [s for s in self._streams if not s.closed]
+            self._streams.append(stream)
+
+    def _forget_stream(self, stream):
+        with self._lock:
+            self._streams = [s for s in self._streams if s is not stream]
+
+    def open_read(self, path):
+        """Return an iterable over the lines of path."""
+        if self._acquire_thread():
+            try:
+                stream = PrefetchReader(path,
+                                        encoding=self.encoding,
+                                        buffer_size=self.buffer_size,
+                                        queue_depth=self.queue_depth,
+                                        on_release=self._release_thread,
+                                        on_close=self._forget_stream)
+            except Exception:
+                self._release_thread()
+                raise
+        else:
+            stream = open_file(path, 'r',
+                               encoding=self.encoding,
+                               newline='')
+
+        self._add_stream(stream)
+        return stream
+
+    def open_write(self, path):
+        """Return a writable file-like object for path."""
+        if self._acquire_thread():
+            try:
+                stream = WriteBehindWriter(path,
+                                           encoding=self.encoding,
+                                           buffer_size=self.buffer_size,
+                                           queue_depth=self.queue_depth,
+                                           on_release=self._release_thread,
+                                           on_close=self._forget_stream)
+            except Exception:
+                self._release_thread()
+                raise
+        else:
+            stream = open_file(path, 'w',
+                               encoding=self.encoding,
+                               newline='')
+
+        self._add_stream(stream)
+        return stream
+
+    def close(self):
+        error = None
+        with self._lock:
+            streams = self._streams
+            self._streams = []
+
+        for stream in reversed(streams):
+            try:
+                stream.close()
+            except Exception as err:
+                if error is None:
+                    error = err
+
+        if error is not None:
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()